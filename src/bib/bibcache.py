@@ -0,0 +1,150 @@
+import os
+import pickle
+import re
+import tempfile
+from pathlib import Path
+
+import citerra
+
+# the only fields the per-citekey scripts read
+CACHE_FIELDS = ("doi", "pmcid", "file")
+
+
+def cache_path(bibpath: Path) -> Path:
+    """Pickle cache lives next to the .bib, e.g. neuropy.bib -> neuropy.bib.pkl."""
+    return bibpath.with_name(bibpath.name + ".pkl")
+
+
+def _bib_stamp(bibpath: Path) -> tuple[int, int]:
+    """(size, mtime_ns) of the .bib, recorded in the cache it was parsed into."""
+    st = bibpath.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def _read_cache(bibpath: Path) -> dict[str, dict[str, str | None]] | None:
+    """Return the cached index if it was built from the .bib as it is now, else None."""
+    try:
+        with open(cache_path(bibpath), "rb") as f:
+            cached = pickle.load(f)
+        # the stamp is taken before parsing, so a .bib rewritten while the cache
+        # was being built never matches it (unlike comparing the pickle's mtime)
+        if isinstance(cached, dict) and cached.get("bib_stamp") == _bib_stamp(bibpath):
+            return cached["index"]
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        pass
+    return None
+
+
+def load_bibcache(bibpath: str | Path) -> dict[str, dict[str, str | None]]:
+    """
+    Return {citekey: {"doi": ..., "pmcid": ..., "file": ...}} for a .bib file.
+    Reuses the pickle cache while the .bib's size and mtime match those it was
+    built from, otherwise parses the .bib once and rewrites the cache.
+    """
+    bibpath = Path(bibpath)
+    index = _read_cache(bibpath)
+    if index is not None:
+        return index
+
+    stamp = _bib_stamp(bibpath)
+    # same parser as fetch.py / merge.py; plain values, lowercase field names
+    with open(bibpath, encoding="utf-8") as f:
+        entries = citerra.document_to_dicts(citerra.load(f, tolerant=True))
+    index = {
+        entry["ID"]: {name: entry.get(name) for name in CACHE_FIELDS}
+        for entry in entries
+    }
+
+    # write-then-rename so parallel Snakemake jobs never read a partial pickle;
+    # a unique temp file per writer, since threads (run_many.py) share a pid
+    cache = cache_path(bibpath)
+    fd, tmp = tempfile.mkstemp(dir=cache.parent, prefix=f"{cache.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump({"bib_stamp": stamp, "index": index}, f, protocol=5)
+        os.replace(tmp, cache)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return index
+
+
+# bare value: number or @string macro name
+_BARE_RE = re.compile(r"[^\s,}#]+")
+_FIELD_RE = re.compile(r"[\s,]*([\w:.+-]+)\s*=\s*")
+
+
+def _read_value(text: str, pos: int) -> tuple[str, int]:
+    """
+    Read one field value ({...}, "..." or bare word, joined by #) starting at pos.
+    Raises ValueError on a malformed value (missing or unterminated).
+    """
+    parts = []
+    end = len(text)
+    while True:
+        while pos < end and text[pos].isspace():
+            pos += 1
+        if pos >= end:
+            raise ValueError(f"missing field value at offset {pos}")
+        if text[pos] in "{\"":
+            close = "}" if text[pos] == "{" else '"'
+            depth, start = 0, pos + 1
+            pos += 1
+            while pos < end and (depth or text[pos] != close):
+                if text[pos] == "{":
+                    depth += 1
+                elif text[pos] == "}":
+                    depth -= 1
+                pos += 1
+            if pos >= end:
+                raise ValueError(f"unterminated field value at offset {start - 1}")
+            parts.append(text[start:pos])
+            pos += 1
+        else:
+            m = _BARE_RE.match(text, pos)
+            if m is None:
+                raise ValueError(f"missing field value at offset {pos}")
+            parts.append(m.group())
+            pos = m.end()
+        while pos < end and text[pos].isspace():
+            pos += 1
+        if pos < end and text[pos] == "#":
+            pos += 1
+            continue
+        return "".join(parts), pos
+
+
+def scan_entry(bibpath: str | Path, citekey: str) -> dict[str, str]:
+    """
+    Find one entry by citekey and parse only its fields, without parsing
+    the rest of the bibliography. Raises KeyError if the citekey is absent,
+    ValueError if its fields are malformed.
+    """
+    text = Path(bibpath).read_text(encoding="utf-8")
+    m = re.search(r"@\s*\w+\s*[{(]\s*" + re.escape(citekey) + r"\s*,", text)
+    if not m:
+        raise KeyError(citekey)
+
+    fields = {}
+    pos = m.end()
+    while (fm := _FIELD_RE.match(text, pos)):
+        fields[fm.group(1).lower()], pos = _read_value(text, fm.end())
+    return fields
+
+
+def get_entry_fields(bibpath: str | Path, citekey: str) -> dict[str, str | None]:
+    """
+    {"doi", "pmcid", "file"} for one citekey: from the cache when it is fresh,
+    otherwise by scanning the .bib only up to that entry.
+    """
+    bibpath = Path(bibpath)
+    index = _read_cache(bibpath)
+    if index is not None:
+        return index[citekey]
+    try:
+        fields = scan_entry(bibpath, citekey)
+    except (KeyError, ValueError):
+        # the scanner missed it or choked on it (unusual or malformed syntax):
+        # parse properly, raise KeyError if truly absent
+        return load_bibcache(bibpath)[citekey]
+    return {name: fields.get(name) for name in CACHE_FIELDS}
@@ -1,33 +1,81 @@
 #!/usr/bin/env python
+import codecs
+import re
 import sys
 import json
+import threading
 from pathlib import Path
 import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from bs4 import BeautifulSoup
-from pybtex.database import parse_file
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import html as lhtml
+from lxml.etree import ParserError
+from selectolax.lexbor import LexborHTMLParser
 
+from .bibcache import get_entry_fields
 from .load_config import get_bib_paths
 
 bib_paths = get_bib_paths()
-bib_db = parse_file(str(bib_paths['project_bib']))
+
+# one session for all requests, so connections to the same host (doi.org,
+# pubmed, pmc) are reused across the URL queue and the image downloads
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": "pixecog-figures-bot/0.1 (personal research)"})
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False
+    ),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+# concurrent image downloads for the whole process, not per page: run_many.py
+# processes several citekeys at once, and their page fetches plus these image
+# slots must stay within the session's pool_maxsize (and be gentle on NCBI)
+IMG_DOWNLOAD_WORKERS = 8
+_IMG_SLOTS = threading.BoundedSemaphore(IMG_DOWNLOAD_WORKERS)
+
+# chunk size for streaming image bodies to disk
+IMG_CHUNK_BYTES = 64 * 1024
+
+# file extension per image Content-Type; unknown types fall back to the URL
+IMAGE_EXTS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/tiff": ".tif",
+    "image/webp": ".webp",
+    "image/svg+xml": ".svg",
+}
+
+# <img> inside <figure> or common figure/fig containers, or any <img> whose
+# alt/title mentions "fig"/"figure" (case-insensitive), matched in one tree walk
+FIGURE_IMG_SELECTOR = (
+    "figure img, div.figures img, div.figure img, div.fig img, li.fig img, li.figure img, "
+    'img[alt*="fig" i], img[title*="fig" i]'
+)
 
 def get_entry(key: str):
-    return bib_db.entries[key]
+    return get_entry_fields(bib_paths['project_bib'], key)
 
 
 def get_field(entry, name: str):
-    return entry.fields.get(name)
+    return entry.get(name)
 
 
-def fetch_html(url: str, headers, timeout: int = 15):
+def fetch_html(url: str, timeout: int = 15):
     """
-    Fetch a URL, return (final_url, text, content_type) or (None, None, None) on failure.
+    Fetch a URL, return (final_url, body bytes, content_type) or (None, None, None) on failure.
     Skips non-HTML content (e.g. direct PDFs).
     """
     try:
-        resp = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True)
+        resp = SESSION.get(url, timeout=timeout, allow_redirects=True)
     except Exception as e:
         print(f"[online] request failed for {url}: {e}")
         return None, None, None
@@ -42,67 +90,103 @@ def fetch_html(url: str, headers, timeout: int = 15):
         print(f"[online] non-HTML content at {resp.url}, skipping")
         return None, None, None
 
-    return resp.url, resp.text, ctype
+    # raw bytes: each parser is given the header charset (see header_charset)
+    # rather than requests guessing one and decoding up front
+    return resp.url, resp.content, ctype
+
+
+def header_charset(ctype: str | None) -> str | None:
+    """Charset named in a Content-Type header (e.g. "text/html; charset=utf-8"), if known."""
+    for param in (ctype or "").split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset":
+            return _known_codec(value.strip().strip("\"'"))
+    return None
+
+
+def _known_codec(name: str) -> str | None:
+    try:
+        codecs.lookup(name)
+    except LookupError:
+        return None
+    return name
 
 
-def extract_img_urls_from_html(base_url: str, html: str):
+def lxml_parser(ctype: str | None) -> lhtml.HTMLParser:
+    """
+    lxml parser for a raw HTML body: lxml sniffs <meta charset> itself but not
+    the HTTP header, so a charset named there is passed explicitly.
+    """
+    try:
+        return lhtml.HTMLParser(encoding=header_charset(ctype))
+    except LookupError:  # a codec Python knows but libxml2 does not
+        return lhtml.HTMLParser()
+
+
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_:.-]+)""", re.I)
+
+
+def decode_html(html: bytes, ctype: str | None) -> str:
+    """
+    Decode an HTML body as a browser would: the HTTP header charset, else the
+    <meta> charset, else UTF-8. selectolax needs this: given bytes it assumes
+    UTF-8 and ignores <meta charset>.
+    """
+    charset = header_charset(ctype)
+    if charset is None:
+        m = _META_CHARSET_RE.search(html, 0, 4096)
+        charset = _known_codec(m.group(1).decode("ascii")) if m else None
+    return html.decode(charset or "utf-8", errors="replace")
+
+
+def extract_img_urls_from_html(base_url: str, html: bytes, ctype: str | None = None):
     """
     Generic figure scraping: collect image URLs from common figure containers.
     Works well on PMC and many journal sites.
     """
-    soup = BeautifulSoup(html, "html.parser")
+    tree = LexborHTMLParser(decode_html(html, ctype))
     img_urls = []
 
-    # 1) <figure> tags
-    for fig in soup.find_all("figure"):
-        for img in fig.find_all("img"):
-            src = img.get("data-src") or img.get("src")
-            if src:
-                img_urls.append(requests.compat.urljoin(base_url, src))
-
-    # 2) Common figure/fig container selectors
-    for selector in ['div.figures', 'div.figure', 'div.fig', 'li.fig', 'li.figure']:
-        for container in soup.select(selector):
-            for img in container.find_all("img"):
-                src = img.get("data-src") or img.get("src")
-                if src:
-                    img_urls.append(requests.compat.urljoin(base_url, src))
-
-    # 3) Fallback: any <img> with "fig"/"figure" mentioned in alt/title
-    for img in soup.find_all("img"):
-        alt = (img.get("alt") or "").lower()
-        title = (img.get("title") or "").lower()
-        if any(tok in alt or tok in title for tok in ("fig", "figure")):
-            src = img.get("data-src") or img.get("src")
-            if src:
-                img_urls.append(requests.compat.urljoin(base_url, src))
+    # figure containers and the alt/title fallback, in one selector pass
+    # (document order; an <img> matching several rules is deduped below)
+    for img in tree.css(FIGURE_IMG_SELECTOR):
+        src = img.attributes.get("data-src") or img.attributes.get("src")
+        if src:
+            img_urls.append(requests.compat.urljoin(base_url, src))
 
     # dedupe while preserving order
-    seen = set()
-    uniq = []
-    for u in img_urls:
-        if u not in seen:
-            seen.add(u)
-            uniq.append(u)
+    return list(dict.fromkeys(img_urls))
+
 
-    return uniq
+def image_ext(ctype: str, img_url: str) -> str:
+    """File extension from the Content-Type, else guessed from the URL (default .png)."""
+    ext = IMAGE_EXTS.get(ctype.split(";")[0].strip())
+    if ext:
+        return ext
+    lower = img_url.lower()
+    for cand in (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".gif"):
+        if cand in lower:
+            return cand
+    return ".png"
 
 
-def find_pmc_links_in_html(base_url: str, html: str):
+def find_pmc_links_in_html(base_url: str, html: bytes, ctype: str | None = None):
     """
     From a PubMed article page, find links to PMC full text.
     Returns a list of absolute PMC URLs.
     """
-    soup = BeautifulSoup(html, "html.parser")
-    pmc_urls = []
-
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        if "pmc.ncbi.nlm.nih.gov" in href:
-            pmc_urls.append(requests.compat.urljoin(base_url, href))
+    # the xpath filter runs in libxml2 and returns the href strings directly
+    try:
+        doc = lhtml.fromstring(html, parser=lxml_parser(ctype))
+    except ParserError:  # e.g. a body of only whitespace / comments
+        return []
+    found = doc.xpath('//a[contains(@href, "pmc.ncbi.nlm.nih.gov")]/@href')
+    # an attribute xpath yields a list of strings; narrowed for the type checker
+    hrefs = [h for h in found if isinstance(h, str)] if isinstance(found, list) else []
 
     # dedupe
-    pmc_urls = list(dict.fromkeys(pmc_urls))
+    pmc_urls = list(dict.fromkeys(requests.compat.urljoin(base_url, h) for h in hrefs))
     if pmc_urls:
         print(f"[online] found PMC links on {base_url}:")
         for u in pmc_urls:
@@ -110,7 +194,7 @@ def find_pmc_links_in_html(base_url: str, html: str):
     return pmc_urls
 
 
-def try_download_from_url(url: str, figs_dir: Path, headers, visited: set, url_queue: list, tried_meta: list):
+def try_download_from_url(url: str, figs_dir: Path, url_queue: deque, enqueued: dict, tried_meta: list):
     """
     Try one URL:
       - fetch HTML
@@ -118,8 +202,7 @@ def try_download_from_url(url: str, figs_dir: Path, headers, visited: set, url_q
       - try to extract <img> figure URLs and download them
     Returns list of {url, file} for downloaded images.
     """
-    visited.add(url)
-    final_url, html, ctype = fetch_html(url, headers)
+    final_url, html, ctype = fetch_html(url)
     if not html:
         tried_meta.append({"url": url, "final_url": final_url, "status": "no_html"})
         return []
@@ -131,47 +214,60 @@ def try_download_from_url(url: str, figs_dir: Path, headers, visited: set, url_q
 
     # If this is a PubMed article page, look for PMC links and enqueue them
     if "pubmed.ncbi.nlm.nih.gov" in host:
-        pmc_candidates = find_pmc_links_in_html(final_url, html)
+        pmc_candidates = find_pmc_links_in_html(final_url, html, ctype)
         for pmc_url in pmc_candidates:
-            if pmc_url not in visited and pmc_url not in url_queue:
+            if pmc_url not in enqueued:
+                enqueued[pmc_url] = None
                 url_queue.append(pmc_url)
 
     # Extract and download figure images
-    img_urls = extract_img_urls_from_html(final_url, html)
+    img_urls = extract_img_urls_from_html(final_url, html, ctype)
     print(f"[online] {len(img_urls)} candidate image URLs from {final_url}")
 
-    downloaded = []
-    for i, img_url in enumerate(img_urls, start=1):
+    def download_img(i: int, img_url: str):
+        fname = None
         try:
-            r = requests.get(img_url, headers=headers, timeout=15)
+            # stream: reject non-images from the headers alone, and write the
+            # body to disk in chunks instead of holding it in memory; the slot
+            # is held until the body is consumed and the connection released
+            with _IMG_SLOTS, SESSION.get(img_url, timeout=15, stream=True) as r:
+                ctype = r.headers.get("Content-Type", "").lower()
+                if r.status_code != 200 or not ctype.startswith("image/"):
+                    return None
+
+                fname = figs_dir / f"figure_{i}{image_ext(ctype, img_url)}"
+                with open(fname, "wb") as out:
+                    # iter_content (not r.raw) so content-encoding is undone
+                    for chunk in r.iter_content(IMG_CHUNK_BYTES):
+                        out.write(chunk)
         except Exception as e:
             print(f"[online] download failed {img_url}: {e}")
-            continue
-        if r.status_code != 200 or not r.content:
-            continue
-
-        ext = ".png"
-        lower = img_url.lower()
-        for cand in (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".gif"):
-            if cand in lower:
-                ext = cand
-                break
-
-        fname = figs_dir / f"figure_{i}{ext}"
-        fname.write_bytes(r.content)
-        downloaded.append({"url": img_url, "file": fname.name})
+            if fname is not None:
+                fname.unlink(missing_ok=True)  # don't leave a truncated image
+            return None
+
+        if fname.stat().st_size == 0:
+            fname.unlink()
+            return None
+
         print(f"[online] {img_url} -> {fname}")
+        return {"url": img_url, "file": fname.name}
+
+    # images are independent: each worker fetches and writes its own file as
+    # soon as it arrives, so bodies are not held until the slowest one is done
+    with ThreadPoolExecutor(max_workers=IMG_DOWNLOAD_WORKERS) as ex:
+        results = ex.map(download_img, range(1, len(img_urls) + 1), img_urls)
+        downloaded = [rec for rec in results if rec is not None]
 
     return downloaded
 
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: download_figures.py <citekey> <outdir>")
-        sys.exit(1)
-
-    citekey = sys.argv[1]
-    outdir = Path(sys.argv[2])
+def process_citekey(citekey: str, outdir: Path):
+    """
+    Scrape and download the figures of one citekey into <outdir>/figs.
+    Safe to run for several citekeys at once (see run_many.py): all state is
+    local except the shared SESSION.
+    """
     figs_dir = outdir / "figs"
     figs_dir.mkdir(parents=True, exist_ok=True)
 
@@ -181,26 +277,26 @@ def main():
 
     print(f"[online] citekey={citekey}, doi={doi}, pmcid={pmcid}")
 
-    headers = {"User-Agent": "pixecog-figures-bot/0.1 (personal research)"}
-
-    url_queue = []
-    visited = set()
+    candidates = []
     tried_meta = []
 
     # 1) If we ever add pmcid to entries, try PMC directly first
     if pmcid:
         pmcid_clean = pmcid.replace("PMC", "").strip()
-        url_queue.append(f"https://pmc.ncbi.nlm.nih.gov/articles/PMC{pmcid_clean}/")
+        candidates.append(f"https://pmc.ncbi.nlm.nih.gov/articles/PMC{pmcid_clean}/")
 
     # 2) DOI landing page
     if doi:
-        url_queue.append(f"https://doi.org/{doi}")
+        candidates.append(f"https://doi.org/{doi}")
         # 3) PubMed search by DOI (will redirect to article page)
-        url_queue.append(f"https://pubmed.ncbi.nlm.nih.gov/?term={doi}")
+        candidates.append(f"https://pubmed.ncbi.nlm.nih.gov/?term={doi}")
 
-    # dedupe while preserving order
-    seen = set()
-    url_queue = [u for u in url_queue if not (u in seen or seen.add(u))]
+    # dedupe while preserving order; `enqueued` is an insertion-ordered set of
+    # every URL ever queued (O(1) membership), `url_queue` the ones still pending.
+    # A URL is only queued when first added to `enqueued`, so each is popped
+    # (visited) at most once and no separate `visited` set is needed
+    enqueued = dict.fromkeys(candidates)
+    url_queue = deque(enqueued)
 
     print("[online] initial URL candidates:")
     for u in url_queue:
@@ -209,15 +305,9 @@ def main():
     downloaded_all = []
 
     # Breadth-first-ish: pop from the front, append PMC links at the end
-    idx = 0
-    while idx < len(url_queue) and not downloaded_all:
-        url = url_queue[idx]
-        idx += 1
-
-        if url in visited:
-            continue
-
-        new_downloads = try_download_from_url(url, figs_dir, headers, visited, url_queue, tried_meta)
+    while url_queue and not downloaded_all:
+        url = url_queue.popleft()
+        new_downloads = try_download_from_url(url, figs_dir, url_queue, enqueued, tried_meta)
         downloaded_all.extend(new_downloads)
 
     if downloaded_all:
@@ -226,7 +316,7 @@ def main():
             "doi": doi,
             "pmcid": pmcid,
             "figures": downloaded_all,
-            "tried_urls": url_queue,
+            "tried_urls": list(enqueued),
             "trace": tried_meta,
         }
         (outdir / "meta.json").write_text(json.dumps(meta, indent=2))
@@ -235,5 +325,13 @@ def main():
         print(f"[online] no usable figures found for {citekey}")
 
 
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: download_figures.py <citekey> <outdir>")
+        sys.exit(1)
+
+    process_citekey(sys.argv[1], Path(sys.argv[2]))
+
+
 if __name__ == "__main__":
     main()
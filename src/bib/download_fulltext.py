@@ -1,30 +1,49 @@
 #!/usr/bin/env python
+import codecs
 import sys
 import json
 from pathlib import Path
 import urllib.parse
+from collections import deque
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
-from pybtex.database import parse_file
+from lxml import html as lhtml
+from lxml.etree import ParserError
 
+from .bibcache import get_entry_fields
 from .load_config import get_bib_paths
 bib_paths = get_bib_paths()
 BIB = bib_paths['project_bib']
-bib_db = parse_file(str(BIB))
+
+# one session for all requests, so connections to the same host (doi.org,
+# pubmed, pmc) are reused across the URL queue
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": "pixecog-fulltext-bot/0.1 (personal research)"})
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False
+    ),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
 
 
 def get_entry(key: str):
-    return bib_db.entries[key]
+    return get_entry_fields(BIB, key)
 
 
 def get_field(entry, name: str):
-    return entry.fields.get(name)
+    return entry.get(name)
 
 
-def fetch_html(url: str, headers, timeout: int = 15):
+def fetch_html(url: str, timeout: int = 15):
     try:
-        resp = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True)
+        resp = SESSION.get(url, timeout=timeout, allow_redirects=True)
     except Exception as e:
         print(f"[fulltext-online] request failed for {url}: {e}")
         return None, None, None
@@ -35,7 +54,37 @@ def fetch_html(url: str, headers, timeout: int = 15):
     if resp.status_code != 200 or "html" not in ctype:
         return None, None, None
 
-    return resp.url, resp.text, ctype
+    # raw bytes: each parser is given the header charset (see header_charset)
+    # rather than requests guessing one and decoding up front
+    return resp.url, resp.content, ctype
+
+
+def header_charset(ctype: str | None) -> str | None:
+    """Charset named in a Content-Type header (e.g. "text/html; charset=utf-8"), if known."""
+    for param in (ctype or "").split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset":
+            return _known_codec(value.strip().strip("\"'"))
+    return None
+
+
+def _known_codec(name: str) -> str | None:
+    try:
+        codecs.lookup(name)
+    except LookupError:
+        return None
+    return name
+
+
+def lxml_parser(ctype: str | None) -> lhtml.HTMLParser:
+    """
+    lxml parser for a raw HTML body: lxml sniffs <meta charset> itself but not
+    the HTTP header, so a charset named there is passed explicitly.
+    """
+    try:
+        return lhtml.HTMLParser(encoding=header_charset(ctype))
+    except LookupError:  # a codec Python knows but libxml2 does not
+        return lhtml.HTMLParser()
 
 
 def candidate_urls_for_entry(entry):
@@ -57,18 +106,21 @@ def candidate_urls_for_entry(entry):
     return urls
 
 
-def find_pmc_links_in_pubmed(base_url: str, html: str):
-    soup = BeautifulSoup(html, "html.parser")
-    pmc_urls = []
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        if "pmc.ncbi.nlm.nih.gov" in href:
-            pmc_urls.append(requests.compat.urljoin(base_url, href))
-    return list(dict.fromkeys(pmc_urls))
+def find_pmc_links_in_pubmed(base_url: str, html: bytes, ctype: str | None = None):
+    # the xpath filter runs in libxml2 and returns the href strings directly
+    try:
+        doc = lhtml.fromstring(html, parser=lxml_parser(ctype))
+    except ParserError:  # e.g. a body of only whitespace / comments
+        return []
+    found = doc.xpath('//a[contains(@href, "pmc.ncbi.nlm.nih.gov")]/@href')
+    # an attribute xpath yields a list of strings; narrowed for the type checker
+    hrefs = [h for h in found if isinstance(h, str)] if isinstance(found, list) else []
+    return list(dict.fromkeys(requests.compat.urljoin(base_url, h) for h in hrefs))
 
 
-def extract_main_text_from_html(html: str):
-    soup = BeautifulSoup(html, "html.parser")
+def extract_main_text_from_html(html: bytes, ctype: str | None = None):
+    # BeautifulSoup sniffs <meta charset> / BOMs, but the header wins when given
+    soup = BeautifulSoup(html, "lxml", from_encoding=header_charset(ctype))
 
     # Prefer main article container if it exists (PMC-style)
     main = soup.find(id="main-content") or soup.find("article")
@@ -80,13 +132,12 @@ def extract_main_text_from_html(html: str):
     return text
 
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: download_fulltext.py <citekey> <outdir>")
-        sys.exit(1)
-
-    citekey = sys.argv[1]
-    outdir = Path(sys.argv[2])
+def process_citekey(citekey: str, outdir: Path):
+    """
+    Find and save the HTML full text of one citekey into outdir.
+    Safe to run for several citekeys at once (see run_many.py): all state is
+    local except the shared SESSION.
+    """
     outdir.mkdir(parents=True, exist_ok=True)
 
     entry = get_entry(citekey)
@@ -95,24 +146,21 @@ def main():
 
     print(f"[fulltext-online] citekey={citekey}, doi={doi}, pmcid={pmcid}")
 
-    headers = {"User-Agent": "pixecog-fulltext-bot/0.1 (personal research)"}
-
-    url_queue = candidate_urls_for_entry(entry)
-    visited = set()
+    # `enqueued` is an insertion-ordered set of every URL ever queued
+    # (O(1) membership), `url_queue` the ones still pending; a URL is only
+    # queued when first added to `enqueued`, so each is visited at most once
+    enqueued = dict.fromkeys(candidate_urls_for_entry(entry))
+    url_queue = deque(enqueued)
     tried = []
 
     full_html = None
+    full_ctype = None
     final_used_url = None
 
-    idx = 0
-    while idx < len(url_queue) and not full_html:
-        url = url_queue[idx]
-        idx += 1
-        if url in visited:
-            continue
-        visited.add(url)
+    while url_queue and not full_html:
+        url = url_queue.popleft()
 
-        final_url, html, ctype = fetch_html(url, headers)
+        final_url, html, ctype = fetch_html(url)
         tried.append({"url": url, "final_url": final_url, "ctype": ctype or "unknown"})
 
         if not html:
@@ -123,25 +171,28 @@ def main():
 
         # If this is a PubMed search page, look for PMC links
         if "pubmed.ncbi.nlm.nih.gov" in host and "/?term=" in (final_url or url):
-            soup = BeautifulSoup(html, "html.parser")
+            soup = BeautifulSoup(html, "lxml", from_encoding=header_charset(ctype))
             first = soup.select_one("a.docsum-title")
             if first and first.get("href"):
                 art_url = requests.compat.urljoin(final_url, first["href"])
-                if art_url not in visited and art_url not in url_queue:
+                if art_url not in enqueued:
+                    enqueued[art_url] = None
                     url_queue.append(art_url)
             continue
 
         # If this is a PubMed article page, follow PMC full-text links
         if "pubmed.ncbi.nlm.nih.gov" in host:
-            pmc_urls = find_pmc_links_in_pubmed(final_url, html)
+            pmc_urls = find_pmc_links_in_pubmed(final_url, html, ctype)
             for pu in pmc_urls:
-                if pu not in visited and pu not in url_queue:
+                if pu not in enqueued:
+                    enqueued[pu] = None
                     url_queue.append(pu)
             continue
 
         # If this is PMC or publisher HTML, we can try to use it as full text
         if "pmc.ncbi.nlm.nih.gov" in host or "learnmem.cshlp.org" in host:
             full_html = html
+            full_ctype = ctype
             final_used_url = final_url
             break
 
@@ -152,20 +203,28 @@ def main():
     # Save HTML and plain text
     html_path = outdir / "full.html"
     txt_path = outdir / "full.txt"
-    html_path.write_text(full_html, encoding="utf-8")
-    txt_path.write_text(extract_main_text_from_html(full_html), encoding="utf-8")
+    html_path.write_bytes(full_html)  # as served, original charset
+    txt_path.write_text(extract_main_text_from_html(full_html, full_ctype), encoding="utf-8")
 
     meta = {
         "source": "online",
         "doi": doi,
         "pmcid": pmcid,
         "used_url": final_used_url,
-        "tried_urls": url_queue,
+        "tried_urls": list(enqueued),
         "trace": tried,
     }
     (outdir / "meta.json").write_text(json.dumps(meta, indent=2))
     print(f"[fulltext-online] saved HTML + text for {citekey} at {html_path} / {txt_path}")
 
 
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: download_fulltext.py <citekey> <outdir>")
+        sys.exit(1)
+
+    process_citekey(sys.argv[1], Path(sys.argv[2]))
+
+
 if __name__ == "__main__":
     main()
@@ -6,13 +6,14 @@ renaming them like:
 Example: jordan_2019_FromSocial.pdf
 
 Features:
-- Idempotent: re-running doesn’t duplicate or recopy unchanged files.
+- Idempotent: re-running doesn’t duplicate or recopy unchanged files
+  (sources whose size + mtime are unchanged are not even re-hashed).
 - Handles {{braces}}, LaTeX escapes (\dots, \textit{...}), etc.
 - Logs missing PDFs to missing_pdfs.txt.
-- Keeps a .pdf_manifest.json with file hashes for change detection.
+- Keeps a .pdf_manifest.json with SHA-256 file hashes for change detection.
 """
 
-import bibtexparser, os, re, shutil, json, hashlib
+import bibtexparser, os, re, shutil, json, hashlib, mmap
 from pathlib import Path
 
 # ---------- paths ----------
@@ -24,16 +25,26 @@ PDF_DIR.mkdir(exist_ok=True)
 MISSING_LOG = ROOT / "missing_pdfs.txt"
 MANIFEST_FILE = ROOT / ".pdf_manifest.json"
 
+# change detection only; sha256 is hardware-accelerated (SHA-NI) on modern CPUs
+HASH_ALG = "sha256"
+# files below this are hashed from a single read(), larger ones via mmap
+SMALL_FILE_BYTES = 32 * 1024 * 1024
+
 # ---------- helpers ----------
 
+_RE_BRACES = re.compile(r"[{}]")
+_RE_LATEX = re.compile(r"\\[A-Za-z]+(\s*\{[^}]*\})?")
+_RE_BAD = re.compile(r"[^0-9A-Za-z _\-\.]+")
+_RE_WS = re.compile(r"\s+")
+
 def clean_text(s: str) -> str:
     """Remove LaTeX markup, braces, and unsafe chars."""
     if not s:
         return ""
-    s = re.sub(r"[{}]", "", s)
-    s = re.sub(r"\\[A-Za-z]+(\s*\{[^}]*\})?", "", s)
-    s = re.sub(r"[^0-9A-Za-z _\-\.]+", "", s)
-    return " ".join(s.split()).strip()
+    s = _RE_BRACES.sub("", s)
+    s = _RE_LATEX.sub("", s)
+    s = _RE_BAD.sub("", s)
+    return _RE_WS.sub(" ", s).strip()
 
 def first_author_lastname(author_field: str) -> str:
     """Extract first author's last name (handles 'Last, First' and 'First Last')."""
@@ -65,13 +76,20 @@ def extract_pdf_path(file_field: str) -> str | None:
         return file_field.strip()
     return None
 
-def md5sum(path: Path) -> str:
-    """Compute MD5 checksum for file contents."""
-    h = hashlib.md5()
+def file_hash(path: Path) -> str:
+    """Compute the HASH_ALG checksum for file contents, without a Python read loop."""
     with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
+        # typical PDFs fit comfortably in memory: one read, one update
+        if os.fstat(f.fileno()).st_size < SMALL_FILE_BYTES:
+            return hashlib.new(HASH_ALG, f.read()).hexdigest()
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.new(HASH_ALG, mm).hexdigest()
+        except OSError:  # not mappable
+            h = hashlib.new(HASH_ALG)
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+            return h.hexdigest()
 
 # ---------- load manifest ----------
 manifest = {}
@@ -117,22 +135,44 @@ for bibfile in sorted(METADATA_DIR.glob("*.bib")):
         newname = f"{author_key}_{year}_{short_cc}.pdf"
         target = PDF_DIR / newname
 
-        src_hash = md5sum(Path(pdf_path))
+        # manifest entries record the algorithm, so entries from older
+        # algorithms (plain MD5 strings) never match and get refreshed
+        prev_entry = manifest.get(newname)
+        if not isinstance(prev_entry, dict) or prev_entry.get("alg") != HASH_ALG:
+            prev_entry = {}
+
+        st = os.stat(pdf_path)
+        src_entry = {
+            "alg": HASH_ALG,
+            "src": str(pdf_path),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        }
 
         # -- idempotent logic --
         if target.exists():
-            prev_hash = manifest.get(newname)
-            if prev_hash == src_hash:
+            # fast path: same source with same size + mtime -> skip hashing
+            if all(prev_entry.get(k) == src_entry[k] for k in ("src", "size", "mtime_ns")):
+                print(f"  ↩︎ Skipping (unchanged): {target.name}")
+                continue
+
+            src_entry["hash"] = file_hash(Path(pdf_path))
+            # no same-algorithm record (e.g. a legacy MD5 manifest): compare with the
+            # target itself, so identical PDFs are not rewritten (and their mtime kept)
+            prev_hash = prev_entry.get("hash") or file_hash(target)
+            if prev_hash == src_entry["hash"]:
                 print(f"  ↩︎ Skipping (unchanged): {target.name}")
+                manifest[newname] = src_entry  # refresh stat info
                 continue
             else:
                 print(f"  ⚠️ Overwriting changed file: {target.name}")
-                shutil.copy(pdf_path, target)
+                shutil.copyfile(pdf_path, target)
         else:
-            shutil.copy(pdf_path, target)
+            src_entry["hash"] = file_hash(Path(pdf_path))
+            shutil.copyfile(pdf_path, target)
             print(f"  ✅ Copied: {target.name}")
 
-        manifest[newname] = src_hash
+        manifest[newname] = src_entry
 
 # ---------- save manifest ----------
 MANIFEST_FILE.write_text(json.dumps(manifest, indent=2))
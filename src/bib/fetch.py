@@ -4,29 +4,38 @@ Copy linked PDFs from all .bib files in ./metadata/ to ./pdfs/,
 preserving original filenames.
 
 Features:
-- Idempotent (uses MD5 manifest to skip unchanged files)
+- Idempotent (uses SHA-256 manifest to skip unchanged files;
+  sources whose size + mtime are unchanged are not re-hashed)
 - Handles multiple .bib files
 - Logs missing PDFs to missing_pdfs.txt
 - Keeps a .pdf_manifest.json for change detection
 """
 
-import bibtexparser, os, re, shutil, json, hashlib
+import citerra, os, re, shutil, json, hashlib, mmap
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 # ---------- paths ----------
 from .load_config import get_bib_paths
 bib_paths = get_bib_paths()
 
+# change detection only; sha256 is hardware-accelerated (SHA-NI) on modern CPUs
+HASH_ALG = "sha256"
+# files below this are hashed from a single read(), larger ones via mmap
+SMALL_FILE_BYTES = 32 * 1024 * 1024
+
 # ---------- helpers ----------
 
+# single-pass equivalent of stripping braces, then LaTeX commands, then
+# unsafe chars (a command's letters may be split by the braces removed first)
+_RE_CLEAN = re.compile(r"\\[{}]*(?:[A-Za-z][A-Za-z{}]*)?|[{}]|[^0-9A-Za-z _\-\.\\{}]+")
+_RE_WS = re.compile(r"\s+")
+
 def clean_text(s: str) -> str:
     """Remove braces and LaTeX markup, just to normalize."""
     if not s:
         return ""
-    s = re.sub(r"[{}]", "", s)
-    s = re.sub(r"\\[A-Za-z]+(\s*\{[^}]*\})?", "", s)
-    s = re.sub(r"[^0-9A-Za-z _\-\.]+", "", s)
-    return " ".join(s.split()).strip()
+    return _RE_WS.sub(" ", _RE_CLEAN.sub("", s)).strip()
 
 def extract_pdf_path(file_field: str) -> str | None:
     """Return the path to a .pdf file from a Better BibTeX file field."""
@@ -46,14 +55,89 @@ def extract_pdf_path(file_field: str) -> str | None:
     return None
 
 
-def md5sum(path: Path) -> str:
-    """Compute MD5 checksum for file contents."""
-    h = hashlib.md5()
+def file_hash(path: Path) -> str:
+    """Compute the HASH_ALG checksum for file contents, without a Python read loop."""
     with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
+        # typical PDFs fit comfortably in memory: one read, one update
+        if os.fstat(f.fileno()).st_size < SMALL_FILE_BYTES:
+            return hashlib.new(HASH_ALG, f.read()).hexdigest()
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.new(HASH_ALG, mm).hexdigest()
+        except OSError:  # not mappable
+            h = hashlib.new(HASH_ALG)
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+            return h.hexdigest()
+
+def _fadvise_sequential(f) -> None:
+    """Hint the kernel to read ahead aggressively on a file we read front to back."""
+    if hasattr(os, "posix_fadvise"):  # not on macOS / Windows
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+def copy_pdf(source: Path, target: Path) -> None:
+    """Copy file contents only (no permission bits), in the kernel where possible."""
+    if hasattr(os, "copy_file_range"):  # Linux; reflinks on Btrfs/XFS
+        try:
+            with open(source, "rb") as fsrc, open(target, "wb") as fdst:
+                _fadvise_sequential(fsrc)
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if n == 0:
+                        break  # short copy: redo it below rather than keep a truncated target
+                    remaining -= n
+            if remaining == 0:
+                return
+        except OSError:
+            pass  # unsupported filesystem / cross-device on old kernels
+    shutil.copyfile(source, target)
+
+def copy_and_hash(source: Path, target: Path) -> str:
+    """Copy source to target and return its HASH_ALG checksum, reading it once."""
+    h = hashlib.new(HASH_ALG)
+    with open(source, "rb") as fsrc, open(target, "wb") as fdst:
+        _fadvise_sequential(fsrc)
+        while chunk := fsrc.read(1 << 20):
             h.update(chunk)
+            fdst.write(chunk)
     return h.hexdigest()
 
+# entries are independent and the work is disk I/O + hashing, which release the GIL
+FETCH_WORKERS = 8
+
+def process_entry(source: Path, target: Path, prev_entry: dict) -> tuple[str, dict]:
+    """
+    Copy one PDF unless it is unchanged. Returns (status, manifest entry) with
+    status "unchanged", "overwritten" or "copied". Touches no shared state,
+    so it can run in a worker thread.
+    """
+    st = source.stat()
+    src_entry = {
+        "alg": HASH_ALG,
+        "src": str(source),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+    }
+
+    if target.exists():
+        # fast path: same source with same size + mtime -> skip hashing
+        if all(prev_entry.get(k) == src_entry[k] for k in ("src", "size", "mtime_ns")):
+            return "unchanged", prev_entry
+
+        src_entry["hash"] = file_hash(source)
+        # no same-algorithm record (e.g. a legacy MD5 manifest): compare with the
+        # target itself, so identical PDFs are not rewritten (and their mtime kept)
+        prev_hash = prev_entry.get("hash") or file_hash(target)
+        if prev_hash == src_entry["hash"]:
+            return "unchanged", src_entry  # refresh stat info
+        copy_pdf(source, target)
+        return "overwritten", src_entry
+
+    # new file: hash while copying instead of reading it twice
+    src_entry["hash"] = copy_and_hash(source, target)
+    return "copied", src_entry
+
 def main():
 	# ---------- load manifest ----------
 	manifest = {}
@@ -63,59 +147,59 @@ def main():
 		except json.JSONDecodeError:
 			manifest = {}
 
-	# reset missing log
-	if bib_paths["missing_log"].exists():
-		bib_paths["missing_log"].unlink()
-
-	if bib_paths["pdf_fetched_log"].exists():
-		bib_paths["pdf_fetched_log"].unlink()
-		bib_paths["pdf_fetched_log"].touch()
-
 	# ---------- main ----------
-	for bibfile in sorted(bib_paths["bib_src_dir"].glob("*.bib")):
-		print(f"📘 Processing {bibfile.name}...")
-		with open(bibfile, encoding="utf-8") as f:
-			bib = bibtexparser.load(f)
-
-		for entry in bib.entries:
-			key = entry.get("ID") or entry.get("key") or "unknown_key"
-			file_field = entry.get("file")
-
-			# no file field
-			if not file_field:
-				print(f"  ❌ No file field for: {key}")
-				with open(bib_paths["missing_log"], "a", encoding="utf-8") as f:
-					f.write(f"No file field: {key}\n")
-				continue
-
-			pdf_path = extract_pdf_path(file_field)
-			if not pdf_path or not os.path.exists(pdf_path):
-				print(f"  ❌ No PDF found for: {key}")
-				with open(bib_paths["missing_log"], "a", encoding="utf-8") as f:
-					f.write(f"No PDF: {key}\t{pdf_path or 'N/A'}\n")
-				continue
-
-			source = Path(pdf_path)
-			target = bib_paths["pdf_dir"] / source.name
-
-			src_hash = md5sum(source)
-
-			# idempotent copy
-			if target.exists():
-				prev_hash = manifest.get(target.name)
-				if prev_hash == src_hash:
-					print(f"  ↩︎ Skipping (unchanged): {target.name}")
+	# both logs are rewritten from scratch each run; hold them open for the loop
+	with open(bib_paths["missing_log"], "w", encoding="utf-8") as missing_fp, \
+			open(bib_paths["pdf_fetched_log"], "w", encoding="utf-8") as fetched_fp:
+		# collect copy jobs from all bib files first, keyed by target name so two
+		# entries never write the same target concurrently (last one wins, as before)
+		jobs = {}
+		for bibfile in sorted(bib_paths["bib_src_dir"].glob("*.bib")):
+			print(f"📘 Processing {bibfile.name}...")
+			with open(bibfile, encoding="utf-8") as f:
+				entries = citerra.document_to_dicts(citerra.load(f, tolerant=True))
+
+			for entry in entries:
+				key = entry.get("ID") or entry.get("key") or "unknown_key"
+				file_field = entry.get("file")
+
+				# no file field
+				if not file_field:
+					print(f"  ❌ No file field for: {key}")
+					missing_fp.write(f"No file field: {key}\n")
+					continue
+
+				pdf_path = extract_pdf_path(file_field)
+				if not pdf_path or not os.path.exists(pdf_path):
+					print(f"  ❌ No PDF found for: {key}")
+					missing_fp.write(f"No PDF: {key}\t{pdf_path or 'N/A'}\n")
 					continue
-				else:
-					print(f"  ⚠️ Overwriting changed file: {target.name}")
-					shutil.copy(source, target)
-			else:
-				shutil.copy(source, target)
-				print(f"  ✅ Copied: {target.name}")
-				with open(bib_paths["pdf_fetched_log"], "a", encoding="utf-8") as f:
-					f.write(f"{target.name}\n")
-			manifest[target.name] = src_hash
 
+				source = Path(pdf_path)
+				target = bib_paths["pdf_dir"] / source.name
+
+				# manifest entries record the algorithm, so entries from older
+				# algorithms (plain MD5 strings) never match and get refreshed
+				prev_entry = manifest.get(target.name)
+				if not isinstance(prev_entry, dict) or prev_entry.get("alg") != HASH_ALG:
+					prev_entry = {}
+
+				jobs.pop(target.name, None)
+				jobs[target.name] = (source, target, prev_entry)
+
+		# idempotent copy; workers only hash/copy, the manifest and logs are
+		# updated here on the main thread as results come back (in job order)
+		with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+			results = ex.map(lambda job: process_entry(*job), jobs.values())
+			for name, (status, src_entry) in zip(jobs, results):
+				if status == "unchanged":
+					print(f"  ↩︎ Skipping (unchanged): {name}")
+				elif status == "overwritten":
+					print(f"  ⚠️ Overwriting changed file: {name}")
+				else:
+					print(f"  ✅ Copied: {name}")
+					fetched_fp.write(f"{name}\n")
+				manifest[name] = src_entry
 
 	# ---------- save manifest ----------
 	bib_paths["manifest_file"].write_text(json.dumps(manifest, indent=2))
@@ -1,10 +1,13 @@
 import re
+import functools
 from pathlib import Path
 import yaml
 from .repo_root import repo_abs
 
 CONFIGFILE = repo_abs("config/config.yaml")
+CITEKEY_RE = re.compile(r'@([\w:-]+)')
 
+@functools.lru_cache(maxsize=1)
 def load_config(configfile=CONFIGFILE):
     with configfile.open("r", encoding="utf-8") as f:
         return yaml.safe_load(f)
@@ -16,9 +19,14 @@ def get_citekeys(md_path: str | Path):
     """
     md_path = Path(md_path)
     text = md_path.read_text(encoding="utf-8")
-    keys = set(re.findall(r'@([\w:-]+)', text))
+    keys = set(CITEKEY_RE.findall(text))
     return sorted(keys)
 
+def _compute_paths(config: dict) -> dict[str, Path]:
+    """Resolve the configured paths against the repo root (no side effects)."""
+    return {key: repo_abs(value) for key, value in config['paths'].items()}
+
+@functools.lru_cache(maxsize=1)
 def get_bib_paths():
     """
     From config dict, get list of .bib file paths.
@@ -29,11 +37,12 @@ def get_bib_paths():
     missing_log: "logs/missing_pdfs.txt"
     manifest_file: "logs/.pdf_manifest.json"
     pdf_fetched_log: "logs/fetched_pdfs.txt"
+
+    Cached: the config is read and parent dirs are made on the first call only.
+    The returned dict is shared between callers, so treat it as read-only.
     """
-    config = load_config()
-    bib_paths = config['paths']
-    for key in bib_paths:
-        bib_paths[key] = repo_abs(bib_paths[key])
+    bib_paths = _compute_paths(load_config())
+    for path in bib_paths.values():
         # make parent dirs
-        bib_paths[key].parent.mkdir(parents=True, exist_ok=True)
-    return bib_paths
\ No newline at end of file
+        path.parent.mkdir(parents=True, exist_ok=True)
+    return bib_paths
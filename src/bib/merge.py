@@ -10,7 +10,8 @@ Features:
 - Keeps a .pdf_manifest.json for change detection
 """
 
-import bibtexparser, os, re, shutil, json, hashlib
+import citerra, os, re, shutil, json, hashlib
+import operator
 from pathlib import Path
 from .fetch import extract_pdf_path
 
@@ -23,34 +24,39 @@ bib_paths = get_bib_paths()
 def merge_bib_files(bib_files, output_file):
     """Merge multiple .bib files into one, deterministically and without side effects."""
     merged_entries = []
+    # user @string macros from all files, so entries using them stay resolvable
+    merged_strings = {}
 
     # deterministic ordering → no random reordering across runs
     for bibfile in sorted(bib_files):
+        # tolerant: a malformed entry is skipped instead of aborting the merge
         with open(bibfile, encoding="utf-8") as f:
-            bib = bibtexparser.load(f)
+            doc = citerra.load(f, tolerant=True)
+        # "value" mode keeps raw values (month macros, bare numbers) for writing back
+        entries = citerra.document_to_dicts(doc, value_mode="value")
+        merged_strings.update((s.name, s.value) for s in doc.strings)
 
-        # deterministic entry order
-        for entry in sorted(bib.entries, key=lambda e: e.get("ID", "")):
+        for entry in entries:
             print(f"Processing entry: {entry.get('ID', 'unknown')}")
 
-            pdf_path = extract_pdf_path(entry.get("file", ""))
+            file_value = entry.get("file")
+            pdf_path = extract_pdf_path(file_value.to_plain_string() if file_value else "")
 
-            # replace file path in-memory only — original files untouched
-            entry = entry.copy()   # break reference to original data
-            entry["file"] = (
-                f"bib/pdfs/{Path(pdf_path).name}"
-                if pdf_path else None
-            )
+            # replace file path in-memory only — the dicts are freshly loaded
+            # and not reused, so no copy is needed; original files untouched
+            if pdf_path:
+                entry["file"] = f"bib/pdfs/{Path(pdf_path).name}"
+            else:
+                entry.pop("file", None)
 
             merged_entries.append(entry)
 
-    # build new merged DB cleanly
-    merged_bib = bibtexparser.bibdatabase.BibDatabase()
-    merged_bib.entries = merged_entries
+    # deterministic entry order: one stable sort across all files
+    merged_entries.sort(key=operator.itemgetter("ID"))
 
     # overwrite final output deterministically
     with open(output_file, "w", encoding="utf-8") as f:
-        bibtexparser.dump(merged_bib, f)
+        f.write(citerra.write_entries(merged_entries, strings=merged_strings))
 
 
 bib_files = list(bib_paths['bib_src_dir'].glob("*.bib"))
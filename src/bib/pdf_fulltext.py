@@ -1,17 +1,21 @@
 #!/usr/bin/env python
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from pybtex.database import parse_file
-from pdfminer.high_level import extract_text
+import pymupdf
+from .bibcache import get_entry_fields, load_bibcache
 from .load_config import get_bib_paths
 from .repo_root import repo_abs
 
 bib_paths = get_bib_paths()
-bib_db = parse_file(str(bib_paths['project_bib']))
 
-def pdf_for_key(key):
-    entry = bib_db.entries[key]
-    file_field = entry.fields.get("file")
+def pdf_for_key(key, index=None):
+    if index is not None:
+        entry = index[key]
+    else:
+        entry = get_entry_fields(bib_paths['project_bib'], key)
+    file_field = entry.get("file")
     if not file_field:
         raise RuntimeError(f"No file= field for {key}")
     pdf_rel = Path(file_field)
@@ -19,15 +23,66 @@ def pdf_for_key(key):
         pdf_rel = Path(*pdf_rel.parts[1:])
     return repo_abs(pdf_rel)
 
+def extract_to_txt(pdf_path: Path, txt_out: Path):
+    # write page by page, so only one page's text is held in memory at a time
+    with pymupdf.open(pdf_path) as doc, open(txt_out, "w", encoding="utf-8") as out:
+        for i, page in enumerate(doc.pages()):
+            if i:
+                out.write("\n")
+            out.write(page.get_text("text"))
+
+# bib index for batch workers, set once per worker process by _init_batch_worker
+_batch_index = None
+
+def _init_batch_worker(index):
+    global _batch_index
+    _batch_index = index
+
+def _extract_key(key, outroot: Path):
+    """Batch worker: resolve and extract one citekey; returns the key if it failed."""
+    try:
+        outdir = outroot / key
+        outdir.mkdir(parents=True, exist_ok=True)
+        extract_to_txt(pdf_for_key(key, _batch_index), outdir / "full.txt")
+    except Exception as e:
+        # one bad key (no file= field, unreadable PDF) must not stop the others
+        print(f"[pdf_fulltext] {key} failed: {e!r}")
+        return key
+    return None
+
+def extract_batch(keys, outroot):
+    """
+    Extract many citekeys at once into <outroot>/<key>/full.txt.
+    The bib index is loaded once here; PDFs are extracted in parallel processes
+    since text extraction is CPU-bound. Returns the citekeys that failed.
+    """
+    outroot = Path(outroot)
+    index = load_bibcache(bib_paths['project_bib'])
+    with ProcessPoolExecutor(
+        max_workers=os.cpu_count(), initializer=_init_batch_worker, initargs=(index,)
+    ) as ex:
+        results = ex.map(_extract_key, keys, [outroot] * len(keys))
+        return [key for key in results if key is not None]
+
 def main():
+    if len(sys.argv) >= 3 and sys.argv[1] == "--batch":
+        keys = sys.argv[3:]
+        failed = extract_batch(keys, sys.argv[2])
+        print(f"[pdf_fulltext] {len(keys) - len(failed)}/{len(keys)} citekeys done")
+        if failed:
+            print(f"[pdf_fulltext] failed: {' '.join(failed)}")
+            sys.exit(1)
+        return
+
+    if len(sys.argv) != 3:
+        print("Usage: pdf_fulltext.py <citekey> <outdir>")
+        print("       pdf_fulltext.py --batch <outroot> <citekey>...")
+        sys.exit(1)
+
     key, outdir = sys.argv[1], Path(sys.argv[2])
     outdir.mkdir(parents=True, exist_ok=True)
 
-    pdf_path = pdf_for_key(key)
-    text = extract_text(str(pdf_path))
-
-    txt_out = outdir / "full.txt"
-    txt_out.write_text(text, encoding="utf-8")
+    extract_to_txt(pdf_for_key(key), outdir / "full.txt")
 
 if __name__ == "__main__":
     main()
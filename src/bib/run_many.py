@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .load_config import get_bib_paths, get_citekeys
+
+bib_paths = get_bib_paths()
+
+# citekeys in flight at once; the work is network-bound, and each module's
+# SESSION is shared by all of them, so connections to PMC/PubMed/doi.org
+# are kept alive across keys instead of per process. At most one page fetch
+# per citekey plus download_figures' process-wide IMG_DOWNLOAD_WORKERS (8)
+# image slots are in flight, which fits the sessions' pool_maxsize of 16
+CITEKEY_WORKERS = 8
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("figures", "fulltext"):
+        print("Usage: run_many.py figures|fulltext <outdir-pattern> [<citekey>...]")
+        print("  e.g. run_many.py figures 'derivatives/figures/{key}/online'")
+        print("  (citekeys default to those listed in extract_config)")
+        sys.exit(1)
+
+    if sys.argv[1] == "figures":
+        from .download_figures import process_citekey
+    else:
+        from .download_fulltext import process_citekey
+
+    pattern = sys.argv[2]
+    keys = sys.argv[3:] or get_citekeys(bib_paths['extract_config'])
+
+    def run(key: str):
+        try:
+            process_citekey(key, Path(pattern.format(key=key)))
+        except Exception as e:
+            # one bad key (e.g. missing from the bib) must not stop the others
+            print(f"[run_many] {key} failed: {e!r}")
+            return key
+        return None
+
+    with ThreadPoolExecutor(max_workers=CITEKEY_WORKERS) as ex:
+        failed = [key for key in ex.map(run, keys) if key is not None]
+
+    print(f"[run_many] {len(keys) - len(failed)}/{len(keys)} citekeys done")
+    if failed:
+        print(f"[run_many] failed: {' '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()